@@ -5,13 +5,47 @@ Replica la lógica de `data_science_index/shared/database.py` sin dependencias d
 """
 from __future__ import annotations
 
-import json
 import os
-from typing import Dict, List, Optional
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
 
+import orjson
 import pandas as pd
-from google.cloud import bigquery
-from google.oauth2 import service_account
+import pyarrow as pa
+
+if TYPE_CHECKING:
+    # Las librerías de Google Cloud se importan al crear el primer cliente (arranque en frío)
+    from google.cloud import bigquery, bigquery_storage
+
+
+CATALOG_CACHE_TTL_SECONDS = 300  # 5 minutos: el catálogo cambia con poca frecuencia
+PARSE_CACHE_SIZE = 4096  # textos únicos de stack/tags/config_json memoizados
+ENVIRONMENT_KEYS = ("dev", "qua", "pro")
+
+_bigquery_clients: Dict[Optional[str], bigquery.Client] = {}
+_bqstorage_client: Optional[bigquery_storage.BigQueryReadClient] = None
+
+
+def get_bigquery_client(project_id: Optional[str] = None) -> bigquery.Client:
+    """Cliente de BigQuery compartido por todo el proceso (uno por proyecto)."""
+    client = _bigquery_clients.get(project_id)
+    if client is None:
+        from google.cloud import bigquery
+
+        client = bigquery.Client(project=project_id) if project_id else bigquery.Client()
+        _bigquery_clients[project_id] = client
+    return client
+
+
+def get_bqstorage_client() -> bigquery_storage.BigQueryReadClient:
+    """Cliente de BigQuery Storage (Arrow sobre gRPC) compartido por todo el proceso."""
+    global _bqstorage_client
+    if _bqstorage_client is None:
+        from google.cloud import bigquery_storage
+
+        _bqstorage_client = bigquery_storage.BigQueryReadClient()
+    return _bqstorage_client
 
 
 class WorksDatabase:
@@ -21,36 +55,85 @@ class WorksDatabase:
         self.project_id = project_id or os.getenv("GCP_PROJECT") or os.getenv("GOOGLE_CLOUD_PROJECT")
         self.dataset_id = dataset_id
 
-        if self.project_id:
-            self.client = bigquery.Client(project=self.project_id)
-        else:
-            self.client = bigquery.Client()
+        self.client = get_bigquery_client(self.project_id)
+        if not self.project_id:
             self.project_id = self.client.project
 
         self.table_index = f"{self.project_id}.{self.dataset_id}.works_index"
         self.table_categories = f"{self.project_id}.{self.dataset_id}.works_categories"
 
+        self._cache: Dict[str, Tuple[float, pd.DataFrame]] = {}
+
+    def _cached(self, key: str, loader: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """Memoiza el resultado de `loader` durante CATALOG_CACHE_TTL_SECONDS."""
+        cached = self._cache.get(key)
+        if cached is not None and (time.time() - cached[0]) < CATALOG_CACHE_TTL_SECONDS:
+            return cached[1]
+        df = loader()
+        self._cache[key] = (time.time(), df)
+        return df
+
+    def _read_table(
+        self,
+        table_name: str,
+        selected_fields: Optional[List[str]] = None,
+        row_restriction: str = "",
+    ) -> pd.DataFrame:
+        """Lee una tabla directamente con la Storage Read API, sin crear un job de consulta."""
+        from google.cloud.bigquery_storage import types as bqstorage_types
+
+        requested_session = bqstorage_types.ReadSession(
+            table=f"projects/{self.project_id}/datasets/{self.dataset_id}/tables/{table_name}",
+            data_format=bqstorage_types.DataFormat.ARROW,
+            read_options=bqstorage_types.ReadSession.TableReadOptions(
+                selected_fields=selected_fields or [],
+                row_restriction=row_restriction,
+            ),
+        )
+        bqs = get_bqstorage_client()
+        session = bqs.create_read_session(
+            parent=f"projects/{self.project_id}",
+            read_session=requested_session,
+        )
+        if not session.streams:
+            return pd.DataFrame(columns=selected_fields or [])
+
+        # Se concatenan los streams en Arrow y se convierte a pandas una sola vez
+        tables = [bqs.read_rows(stream.name).to_arrow(session) for stream in session.streams]
+        return pa.concat_tables(tables).to_pandas()
+
     # ------------------------------------------------------------------
     # Lecturas de catálogo
     # ------------------------------------------------------------------
 
     def fetch_all_works(self) -> pd.DataFrame:
-        query = f"""
-        SELECT *
-        FROM `{self.table_index}`
-        WHERE status = 'active'
-        ORDER BY category, created_date DESC
-        """
-        return self.client.query(query).to_dataframe()
+        return self._cached("works", self._load_all_works)
 
     def fetch_categories(self) -> pd.DataFrame:
-        query = f"""
-        SELECT category_id, category_name, category_icon, description, display_order
-        FROM `{self.table_categories}`
-        WHERE is_active = true
-        ORDER BY display_order, category_name
-        """
-        return self.client.query(query).to_dataframe()
+        return self._cached("categories", self._load_categories)
+
+    def _load_all_works(self) -> pd.DataFrame:
+        works_df = self._read_table("works_index", row_restriction="status = 'active'")
+        if works_df.empty:
+            return works_df
+        # Equivale a `ORDER BY category, created_date DESC` de BigQuery, que ubica los NULL
+        # primero en ASC y al final en DESC. Como pandas usa un solo `na_position` por llamada,
+        # se ordena en dos pasadas estables: primero la clave secundaria y luego la principal.
+        works_df = works_df.sort_values(by="created_date", ascending=False, na_position="last", kind="stable")
+        return works_df.sort_values(by="category", na_position="first", kind="stable", ignore_index=True)
+
+    def _load_categories(self) -> pd.DataFrame:
+        categories_df = self._read_table(
+            "works_categories",
+            selected_fields=["category_id", "category_name", "category_icon", "description", "display_order"],
+            row_restriction="is_active = true",
+        )
+        if categories_df.empty:
+            return categories_df
+        # `ORDER BY display_order, category_name`: en BigQuery los NULL van primero en ASC
+        return categories_df.sort_values(
+            by=["display_order", "category_name"], na_position="first", ignore_index=True
+        )
 
 
 def sanitize_text(value: Optional[str]) -> str:
@@ -67,45 +150,52 @@ def normalize_category(row: dict, fallback_map: Dict[str, str]) -> Dict[str, str
     }
 
 
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_list_text(text: str) -> Tuple[str, ...]:
+    """Parsea una lista JSON o CSV; memoizado porque los textos se repiten entre obras."""
+    text = text.strip()
+    if not text:
+        return ()
+    try:
+        parsed = orjson.loads(text)
+        if isinstance(parsed, list):
+            return tuple(sanitize_text(item) for item in parsed if sanitize_text(item))
+    except Exception:
+        pass
+    return tuple(sanitize_text(part) for part in text.split(',') if sanitize_text(part))
+
+
 def parse_list_field(value) -> List[str]:
     if isinstance(value, list):
         return [sanitize_text(item) for item in value if sanitize_text(item)]
     if isinstance(value, str):
-        text = value.strip()
-        if not text:
-            return []
-        try:
-            import json
-
-            parsed = json.loads(text)
-            if isinstance(parsed, list):
-                return [sanitize_text(item) for item in parsed if sanitize_text(item)]
-        except Exception:
-            pass
-        return [sanitize_text(part) for part in text.split(',') if sanitize_text(part)]
+        return list(_parse_list_text(value))
     return []
 
 
-def build_environment_links(config_json: Optional[str]) -> Dict[str, Dict[str, Optional[str]]]:
-    envs = {
-        "dev": {"label": "DEV", "url": None},
-        "qua": {"label": "QUA", "url": None},
-        "pro": {"label": "PRO", "url": None},
-    }
-
-    if not config_json:
-        return envs
-
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_environment_urls(config_json: str) -> Tuple[Optional[str], ...]:
+    """URLs por ambiente (en el orden de ENVIRONMENT_KEYS) extraídas de `config_json`."""
+    urls: List[Optional[str]] = [None] * len(ENVIRONMENT_KEYS)
     try:
-        import json
-
-        config = json.loads(config_json)
-        for key in envs.keys():
+        config = orjson.loads(config_json)
+        for position, key in enumerate(ENVIRONMENT_KEYS):
             url = config.get("environments", {}).get(key) if isinstance(config, dict) else None
             if isinstance(url, str) and url.strip():
-                envs[key]["url"] = url.strip()
+                urls[position] = url.strip()
     except Exception:
         pass
+    return tuple(urls)
 
-    return envs
 
+def build_environment_links(config_json: Optional[str]) -> Dict[str, Dict[str, Optional[str]]]:
+    # Se construyen dicts nuevos en cada llamada: el llamador los modifica (URL por defecto)
+    envs = {key: {"label": key.upper(), "url": None} for key in ENVIRONMENT_KEYS}
+
+    if not config_json or not isinstance(config_json, (str, bytes)):
+        return envs
+
+    for key, url in zip(ENVIRONMENT_KEYS, _parse_environment_urls(config_json)):
+        envs[key]["url"] = url
+
+    return envs
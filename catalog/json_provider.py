@@ -0,0 +1,22 @@
+"""
+Serialización JSON con orjson compartida por las apps Flask del portal.
+"""
+from __future__ import annotations
+
+import orjson
+from flask.json.provider import JSONProvider
+
+
+# OPT_SORT_KEYS conserva el orden de claves del proveedor por defecto de Flask (sort_keys=True),
+# del que depende el frontend (p. ej. el orden DEV · PRO · QUA de los ambientes)
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+
+
+class ORJSONProvider(JSONProvider):
+    """Serializa las respuestas de `jsonify` con orjson (acepta escalares y arrays de NumPy)."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
@@ -1,25 +1,49 @@
+import hashlib
 import os
-from collections import Counter
 
+import orjson
 import pandas as pd
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request, send_from_directory
 
 from catalog.database import (
+    CATALOG_CACHE_TTL_SECONDS,
     WorksDatabase,
     build_environment_links,
     normalize_category,
     parse_list_field,
     sanitize_text,
 )
+from catalog.json_provider import ORJSON_OPTIONS, ORJSONProvider
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-db = WorksDatabase()
+# Tiempo que el navegador reutiliza index.html antes de revalidarlo (independiente del TTL de datos)
+PORTAL_PAGE_MAX_AGE_SECONDS = 300
+
+# El cliente de BigQuery se crea con la primera petición al catálogo, no al importar el módulo:
+# el arranque en frío (y /api/health, /) no espera la resolución de credenciales de Google
+db = None
+
+# Respuesta serializada de /api/catalog como tupla (works_df, categories_df, etag, body).
+# No tiene TTL propio: se regenera cuando WorksDatabase entrega otros DataFrames (su memo de
+# CATALOG_CACHE_TTL_SECONDS es la única fuente de vencimiento). Se reemplaza completa, nunca se
+# modifica, para que cada petición lea un ETag y un cuerpo de la misma versión.
+_catalog_cache = None
 
 app = Flask(__name__)
 
 
+app.json = ORJSONProvider(app)
+
+
+def get_works_database() -> WorksDatabase:
+    global db
+    if db is None:
+        db = WorksDatabase()
+    return db
+
+
 def format_timestamp(value) -> str:
     if value is None or value == "":
         return ""
@@ -35,8 +59,8 @@ def format_timestamp(value) -> str:
 @app.route('/', methods=['GET'])
 def serve_portal():
     """Entrega la página principal del portal de ciencia de datos."""
-    with open(os.path.join(BASE_DIR, 'index.html'), 'r', encoding='utf-8') as f:
-        return f.read()
+    # send_from_directory fija Content-Type y responde 304 a peticiones condicionales
+    return send_from_directory(BASE_DIR, 'index.html', max_age=PORTAL_PAGE_MAX_AGE_SECONDS)
 
 
 @app.route('/api/health', methods=['GET'])
@@ -45,103 +69,125 @@ def health_check():
     return jsonify({"status": "ok"})
 
 
-@app.route('/api/catalog', methods=['GET'])
-def load_catalog():
-    try:
-        works_df = db.fetch_all_works()
-        categories_df = db.fetch_categories()
-
-        category_names = {
-            sanitize_text(row.get("category_id")): sanitize_text(row.get("category_name"))
-            for _, row in categories_df.iterrows()
-        } if not categories_df.empty else {}
-
-        category_label_map = {}
-
-        works = []
-        for _, row in works_df.iterrows():
-            row_dict = row.to_dict()
-            category_info = normalize_category(row_dict, category_names)
-            category_label_map[category_info["id"]] = category_info["name"]
-
-            environments = build_environment_links(row_dict.get("config_json"))
-            primary_url = sanitize_text(row_dict.get("work_url"))
-            for env_key, env_value in environments.items():
-                if not env_value["url"] and primary_url:
-                    env_value["url"] = primary_url
-
-            if not primary_url:
-                for env_key in ["pro", "qua", "dev"]:
-                    if environments.get(env_key, {}).get("url"):
-                        primary_url = environments[env_key]["url"]
-                        break
-
-            works.append({
-                "id": sanitize_text(row_dict.get("work_id")) or sanitize_text(row_dict.get("work_slug")) or "",
-                "title": sanitize_text(row_dict.get("work_name")) or "Proyecto sin título",
-                "summary": sanitize_text(row_dict.get("short_description")) or sanitize_text(row_dict.get("description")),
-                "description": sanitize_text(row_dict.get("description")),
-                "category_id": category_info["id"],
-                "category_name": category_info["name"],
-                "status": sanitize_text(row_dict.get("status")) or "active",
-                "owner": sanitize_text(row_dict.get("owner")) or "Equipo de Data Science",
-                "version": sanitize_text(row_dict.get("version")) or "",
-                "last_update": format_timestamp(row_dict.get("updated_date")) or format_timestamp(row_dict.get("created_date")),
-                "stack": parse_list_field(row_dict.get("stack")),
-                "tags": parse_list_field(row_dict.get("tags")),
-                "environments": environments,
-                "primary_url": primary_url,
+def build_catalog_payload(works_df: pd.DataFrame, categories_df: pd.DataFrame) -> dict:
+    """Arma el catálogo completo (categorías, obras y conteos) a partir de las tablas de BigQuery."""
+
+    category_names = dict(zip(
+        categories_df["category_id"].map(sanitize_text),
+        categories_df["category_name"].map(sanitize_text),
+    )) if not categories_df.empty else {}
+
+    category_label_map = {}
+
+    works = []
+    # `to_dict("records")` entrega dicts nativos sin construir una Series por fila
+    for row_dict in works_df.to_dict(orient="records"):
+        category_info = normalize_category(row_dict, category_names)
+        category_label_map[category_info["id"]] = category_info["name"]
+
+        environments = build_environment_links(row_dict.get("config_json"))
+        primary_url = sanitize_text(row_dict.get("work_url"))
+        for env_key, env_value in environments.items():
+            if not env_value["url"] and primary_url:
+                env_value["url"] = primary_url
+
+        if not primary_url:
+            for env_key in ["pro", "qua", "dev"]:
+                if environments.get(env_key, {}).get("url"):
+                    primary_url = environments[env_key]["url"]
+                    break
+
+        works.append({
+            "id": sanitize_text(row_dict.get("work_id")) or sanitize_text(row_dict.get("work_slug")) or "",
+            "title": sanitize_text(row_dict.get("work_name")) or "Proyecto sin título",
+            "summary": sanitize_text(row_dict.get("short_description")) or sanitize_text(row_dict.get("description")),
+            "description": sanitize_text(row_dict.get("description")),
+            "category_id": category_info["id"],
+            "category_name": category_info["name"],
+            "status": sanitize_text(row_dict.get("status")) or "active",
+            "owner": sanitize_text(row_dict.get("owner")) or "Equipo de Data Science",
+            "version": sanitize_text(row_dict.get("version")) or "",
+            "last_update": format_timestamp(row_dict.get("updated_date")) or format_timestamp(row_dict.get("created_date")),
+            "stack": parse_list_field(row_dict.get("stack")),
+            "tags": parse_list_field(row_dict.get("tags")),
+            "environments": environments,
+            "primary_url": primary_url,
+        })
+
+    # Mismo criterio que `normalize_category` ("otros" si falta), contado sobre la columna
+    if works_df.empty:
+        counter = {}
+    else:
+        category_ids = works_df["category"].map(sanitize_text).replace("", "otros")
+        counter = category_ids.value_counts(sort=False).to_dict()
+
+    categories = []
+    if not categories_df.empty:
+        for row in categories_df.to_dict(orient="records"):
+            cat_id = sanitize_text(row.get("category_id"))
+            categories.append({
+                "id": cat_id,
+                "name": sanitize_text(row.get("category_name")) or cat_id.title(),
+                "icon": sanitize_text(row.get("category_icon")),
+                "description": sanitize_text(row.get("description")),
+                "display_order": int(row.get("display_order", 0)) if pd.notna(row.get("display_order")) else 0,
+                "count": counter.get(cat_id, 0),
+            })
+    else:
+        for cat_id, cat_name in category_names.items():
+            categories.append({
+                "id": cat_id,
+                "name": cat_name or cat_id.title(),
+                "icon": "",
+                "description": "",
+                "display_order": 0,
+                "count": counter.get(cat_id, 0),
             })
 
-        counter = Counter([work["category_id"] for work in works])
-
-        categories = []
-        if not categories_df.empty:
-            for _, row in categories_df.iterrows():
-                cat_id = sanitize_text(row.get("category_id"))
-                categories.append({
-                    "id": cat_id,
-                    "name": sanitize_text(row.get("category_name")) or cat_id.title(),
-                    "icon": sanitize_text(row.get("category_icon")),
-                    "description": sanitize_text(row.get("description")),
-                    "display_order": int(row.get("display_order", 0)) if pd.notna(row.get("display_order")) else 0,
-                    "count": counter.get(cat_id, 0),
-                })
-        else:
-            for cat_id, cat_name in category_names.items():
-                categories.append({
-                    "id": cat_id,
-                    "name": cat_name or cat_id.title(),
-                    "icon": "",
-                    "description": "",
-                    "display_order": 0,
-                    "count": counter.get(cat_id, 0),
-                })
-
-        categories.sort(key=lambda item: (item.get("display_order", 0), item.get("name", "")))
-
-        if not categories and counter:
-            for cat_id in sorted(counter.keys()):
-                categories.append({
-                    "id": cat_id,
-                    "name": category_label_map.get(cat_id, cat_id.title()),
-                    "icon": "",
-                    "description": "",
-                    "display_order": 0,
-                    "count": counter.get(cat_id, 0),
-                })
-            categories.sort(key=lambda item: item.get("name", ""))
-
-        response = {
-            "categories": categories,
-            "works": works,
-            "counts": {
-                "total": len(works),
-                "per_category": {key: counter[key] for key in counter}
-            }
+    categories.sort(key=lambda item: (item.get("display_order", 0), item.get("name", "")))
+
+    if not categories and counter:
+        for cat_id in sorted(counter.keys()):
+            categories.append({
+                "id": cat_id,
+                "name": category_label_map.get(cat_id, cat_id.title()),
+                "icon": "",
+                "description": "",
+                "display_order": 0,
+                "count": counter.get(cat_id, 0),
+            })
+        categories.sort(key=lambda item: item.get("name", ""))
+
+    return {
+        "categories": categories,
+        "works": works,
+        "counts": {
+            "total": len(works),
+            "per_category": {key: counter[key] for key in counter}
         }
+    }
+
 
-        return jsonify(response)
+@app.route('/api/catalog', methods=['GET'])
+def load_catalog():
+    global _catalog_cache
+    try:
+        works_db = get_works_database()
+        works_df = works_db.fetch_all_works()
+        categories_df = works_db.fetch_categories()
+
+        cached = _catalog_cache
+        if cached is None or cached[0] is not works_df or cached[1] is not categories_df:
+            body = orjson.dumps(build_catalog_payload(works_df, categories_df), option=ORJSON_OPTIONS)
+            cached = (works_df, categories_df, hashlib.sha1(body).hexdigest(), body)
+            _catalog_cache = cached
+
+        _, _, etag, body = cached
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f'max-age={CATALOG_CACHE_TTL_SECONDS}'
+        # make_conditional compara If-None-Match en forma débil (RFC 9110) y responde 304
+        return response.make_conditional(request)
     except Exception as error:
         print(f"ERROR /api/catalog: {error}")
         return jsonify({"error": "No se pudo cargar el catálogo", "details": str(error)}), 500
@@ -5,15 +5,20 @@
 # Procesa datos de BigQuery y devuelve JSON para el frontend HTML/JS.
 # =============================================================================
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 import numpy as np
+import orjson
 import pandas as pd
-from scipy.signal import find_peaks
-from google.cloud import bigquery
+import pyarrow as pa
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import warnings
 import time
 import os # Importar os para la ruta de la aplicación
 
+from catalog.json_provider import ORJSON_OPTIONS, ORJSONProvider
+
 # Ocultar advertencias de Pandas/Numpy
 warnings.filterwarnings('ignore')
 
@@ -23,6 +28,7 @@ warnings.filterwarnings('ignore')
 # que es /app dentro del contenedor.
 # ESTA CORRECCIÓN SOLUCIONA EL ERROR 503 EN CLOUD RUN
 app = Flask(__name__, static_folder=os.path.dirname(os.path.abspath(__file__)))
+app.json = ORJSONProvider(app)
 
 
 # --- Caching global para la data de BigQuery ---
@@ -31,69 +37,336 @@ _calls_df_cache = None
 _last_data_fetch_time = 0
 CACHE_EXPIRY_SECONDS = 3600  # 1 hora de caché
 
+# Serializa la primera carga y evita lanzar más de una recarga en segundo plano a la vez
+_cache_lock = threading.Lock()
+_refresh_in_progress = False
+
+# Claves de mes ya serializadas para la tabla anual ("1".."12")
+MONTH_KEYS = [str(month) for month in range(1, 13)]
+
+# Formato binario columnar opcional para /api/companies (vía cabecera Accept)
+ARROW_STREAM_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+# Combinación que usa el frontend por defecto; se precalcula para todas las compañías
+DEFAULT_DETECTION_METHOD = "Hybrid (3-4 months)"
+DEFAULT_ANALYSIS_MODE = "percentages"
+
+# Respuestas de análisis ya serializadas: (company_id, método, modo, versión de la data) -> bytes JSON.
+# La versión es el _last_data_fetch_time de la carga usada, así que una recarga las invalida.
+# - _precomputed_analyses: combinación por defecto de todas las compañías, armada en cada recarga
+# - _analysis_cache: resto de combinaciones, calculadas bajo demanda con desalojo LRU
+ANALYSIS_CACHE_MAX_ENTRIES = 256
+_precomputed_analyses = {}
+_analysis_cache = OrderedDict()
+_analysis_cache_lock = threading.Lock()
+
+# Agregados por compañía derivados de _calls_df_cache (se recalculan junto con ella)
+_monthly_frames = None
+_company_summary = None
+
+# Lista para el selector de compañías, ordenada por nombre y ya serializada en JSON
+_companies_df = None
+_companies_json = None
+
+# Clientes de BigQuery (REST con pool de conexiones) y BigQuery Storage (Arrow sobre gRPC),
+# creados una sola vez por proceso y reutilizados entre recargas de caché
+BIGQUERY_HTTP_POOL_SIZE = 20
+_bq_client = None
+_bqstorage_client = None
+
 # =============================================================================
 # 1. FUNCIONES DE BIGQUERY Y MOCK DATA
 # =============================================================================
 
-def get_calls_info():
+def get_bigquery_clients():
     """
-    Extrae información consolidada de llamadas desde BigQuery.
-    Usa caching simple para evitar llamadas repetidas a la DB.
-    
-    NOTA: Se usa MOCK DATA si la caché está vacía, para permitir la ejecución local 
-    sin credenciales activas de BQ, o si no se está en un entorno Cloud Run/Compute Engine.
+    Devuelve (cliente BigQuery, cliente BigQuery Storage), creándolos en la primera llamada.
+    El cliente REST usa una sesión autorizada con un pool de conexiones HTTP persistentes,
+    así las recargas no repiten el handshake TLS ni la resolución de credenciales.
+    """
+    global _bq_client, _bqstorage_client
+    if _bq_client is None:
+        # Import diferido: con USE_MOCK_DATA=1 el proceso nunca carga las librerías de Google Cloud
+        import google.auth
+        from google.auth.transport.requests import AuthorizedSession
+        from google.cloud import bigquery, bigquery_storage
+        from requests.adapters import HTTPAdapter
+
+        # Intenta usar las credenciales de Cloud Run/Compute Engine
+        credentials, project_id = google.auth.default(scopes=bigquery.Client.SCOPE)
+        session = AuthorizedSession(credentials)
+        session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=BIGQUERY_HTTP_POOL_SIZE))
+        _bqstorage_client = bigquery_storage.BigQueryReadClient(credentials=credentials)
+        _bq_client = bigquery.Client(project=project_id, credentials=credentials, _http=session)
+    return _bq_client, _bqstorage_client
+
+
+def fetch_calls_from_bigquery():
+    """Ejecuta la consulta consolidada de llamadas en BigQuery."""
+    client, bqstorage_client = get_bigquery_clients()
+
+    # Consulta SQL tomada del dashboard original (Streamlit). Sin ORDER BY: el orden
+    # global obliga a BigQuery a un sort final de todo el resultado que aquí no se usa.
+    query = """
+       SELECT c.company_id AS company_id
+            , c.company_name AS company_name
+            , COUNT(DISTINCT cl.campaign_id) AS campaigns
+            , COUNT(cl.lead_call_customer_id) AS customers
+            , cl.location_state AS state
+            , EXTRACT(YEAR FROM DATE(cl.lead_call_created_on)) AS year
+            , EXTRACT(MONTH FROM DATE(cl.lead_call_created_on)) AS month
+            , COUNT(cl.lead_call_id) AS calls
+         FROM `pph-central.analytical.vw_consolidated_call_inbound_location` cl
+         JOIN `pph-central.settings.companies` c
+           ON cl.company_id = c.company_id
+        WHERE DATE(cl.lead_call_created_on) < DATE('2025-10-01')
+          AND EXTRACT(YEAR FROM DATE(cl.lead_call_created_on)) >= 2015
+        GROUP BY c.company_id,
+                 c.company_name,
+                 cl.location_state,
+                 EXTRACT(YEAR FROM DATE(cl.lead_call_created_on)),
+                 EXTRACT(MONTH FROM DATE(cl.lead_call_created_on))
     """
-    global _calls_df_cache, _last_data_fetch_time
-    
-    # Check if data is cached and not expired
-    if _calls_df_cache is not None and (time.time() - _last_data_fetch_time) < CACHE_EXPIRY_SECONDS:
-        return _calls_df_cache
     
+    # Ejecutar la consulta y descargar el resultado por la Storage Read API (Arrow),
+    # conservando columnas respaldadas por Arrow en el DataFrame
+    df = (
+        client.query(query)
+        .to_arrow(bqstorage_client=bqstorage_client)
+        .to_pandas(types_mapper=pd.ArrowDtype)
+    )
+    return df
+
+
+def generate_mock_calls_data(seed=0):
+    """
+    Data sintética con las mismas columnas que la consulta de BigQuery,
+    para ejecutar el backend en local sin credenciales (USE_MOCK_DATA=1).
+    """
+    rng = np.random.default_rng(seed)
+    # Grilla compañía × estado × año × mes construida de una vez (mismo orden que los bucles anidados)
+    company_ids, states, years, months = (grid.ravel() for grid in np.meshgrid(
+        np.arange(1, 6), np.array(['TX', 'FL', 'CA']), np.arange(2021, 2025), np.arange(1, 13),
+        indexing='ij',
+    ))
+    seasonality = 1.0 + 0.5 * np.sin((months + company_ids) * (np.pi / 6))
+    calls = rng.integers(50, 300, size=months.size) * seasonality
+    return pd.DataFrame({
+        'company_id': company_ids,
+        'company_name': np.char.add('Mock Company ', company_ids.astype(str)),
+        'campaigns': rng.integers(1, 10, size=months.size),
+        'customers': rng.integers(10, 200, size=months.size),
+        'state': states,
+        'year': years,
+        'month': months,
+        'calls': calls.astype(np.int64),
+    })
+
+
+def refresh_calls_cache():
+    """
+    Carga la data (BigQuery o MOCK DATA) y reemplaza la caché junto con todos sus derivados.
+    Los derivados se construyen primero y se publican al final, para que los hilos que
+    sigan sirviendo la caché anterior nunca vean un estado a medio construir.
+    """
+    global _calls_df_cache, _last_data_fetch_time, _precomputed_analyses, _analysis_cache
+    global _monthly_frames, _company_summary
+    global _companies_df, _companies_json
+
+    use_mock_data = os.getenv('USE_MOCK_DATA') == '1'
     try:
-        # Intenta usar las credenciales de Cloud Run/Compute Engine
-        client = bigquery.Client()
-
-        # Consulta SQL tomada del dashboard original (Streamlit)
-        query = """
-           SELECT c.company_id AS company_id
-                , c.company_name AS company_name
-                , COUNT(DISTINCT cl.campaign_id) AS campaigns
-                , COUNT(cl.lead_call_customer_id) AS customers
-                , cl.location_state AS state
-                , EXTRACT(YEAR FROM DATE(cl.lead_call_created_on)) AS year
-                , EXTRACT(MONTH FROM DATE(cl.lead_call_created_on)) AS month
-                , COUNT(cl.lead_call_id) AS calls
-             FROM `pph-central.analytical.vw_consolidated_call_inbound_location` cl
-             JOIN `pph-central.settings.companies` c
-               ON cl.company_id = c.company_id
-            WHERE DATE(cl.lead_call_created_on) < DATE('2025-10-01')
-              AND EXTRACT(YEAR FROM DATE(cl.lead_call_created_on)) >= 2015
-            GROUP BY c.company_id,
-                     c.company_name,
-                     cl.location_state,
-                     EXTRACT(YEAR FROM DATE(cl.lead_call_created_on)),
-                     EXTRACT(MONTH FROM DATE(cl.lead_call_created_on))
-            ORDER BY c.company_id,
-                     cl.location_state,
-                     EXTRACT(YEAR FROM DATE(cl.lead_call_created_on)),
-                     EXTRACT(MONTH FROM DATE(cl.lead_call_created_on))
-        """
-        
-        # Ejecutar la consulta
-        df = client.query(query).to_dataframe()
-        
+        df = generate_mock_calls_data() if use_mock_data else fetch_calls_from_bigquery()
+        fetched_at = time.time()
+
+        # Los análisis se sirven desde los agregados por compañía (ya ordenados al construirlos),
+        # por lo que la data cruda no necesita ningún orden. Como categórica, los group-by
+        # por compañía operan sobre códigos enteros en lugar de comparar strings.
+        df['company_id'] = df['company_id'].astype(str).astype('category')
+
+        monthly_frames, company_summary = build_company_aggregates(df)
+        company_names = {
+            company_id: summary['company_name'] if pd.notna(summary.get('company_name')) else company_id
+            for company_id, summary in company_summary.items()
+        }
+        companies_df = pd.DataFrame({
+            'company_id': list(company_names.keys()),
+            'company_name': list(company_names.values())
+        }).sort_values(by='company_name', kind='stable')
+        # Serialización columna a columna de pandas, sin pasar por una lista de dicts
+        companies_json = '{"companies":' + companies_df.to_json(orient='records') + '}'
+        precomputed_analyses = precompute_default_analyses(monthly_frames, company_summary, fetched_at)
+
         # Almacenar en caché y actualizar tiempo
+        _monthly_frames, _company_summary = monthly_frames, company_summary
+        _companies_df, _companies_json = companies_df, companies_json
+        _precomputed_analyses, _analysis_cache = precomputed_analyses, OrderedDict()
         _calls_df_cache = df
-        _last_data_fetch_time = time.time()
-        
-        print("INFO: Data cargada exitosamente desde BigQuery.")
+        # Se publica al final: quien lea esta versión ya ve los agregados correspondientes
+        _last_data_fetch_time = fetched_at
+
+        print(f"INFO: Data cargada exitosamente desde {'MOCK DATA' if use_mock_data else 'BigQuery'}.")
         return df
-        
+
     except Exception as e:
-        print(f"ERROR: Falló la conexión a BigQuery: {e}")
+        print(f"ERROR: Falló la carga de datos ({'MOCK DATA' if use_mock_data else 'BigQuery'}): {e}")
         raise
 
 
+def _refresh_calls_cache_in_background():
+    global _refresh_in_progress
+    try:
+        refresh_calls_cache()
+    except Exception:
+        # El error ya quedó registrado; se sigue sirviendo la caché anterior
+        pass
+    finally:
+        with _cache_lock:
+            _refresh_in_progress = False
+
+
+def get_calls_info():
+    """
+    Extrae información consolidada de llamadas desde BigQuery.
+    Usa caching simple para evitar llamadas repetidas a la DB.
+
+    Stale-while-revalidate: si la caché expiró se devuelve la versión anterior y un único
+    hilo en segundo plano la recarga. Solo la primera carga bloquea (una vez por proceso).
+    
+    NOTA: Con USE_MOCK_DATA=1 se usa MOCK DATA en lugar de BigQuery, para permitir
+    la ejecución local sin credenciales activas de BQ.
+    """
+    global _refresh_in_progress
+
+    if _calls_df_cache is not None:
+        if (time.time() - _last_data_fetch_time) >= CACHE_EXPIRY_SECONDS:
+            with _cache_lock:
+                if not _refresh_in_progress:
+                    _refresh_in_progress = True
+                    threading.Thread(target=_refresh_calls_cache_in_background, daemon=True).start()
+        return _calls_df_cache
+
+    with _cache_lock:
+        # Otro hilo pudo completar la primera carga mientras esperábamos el lock
+        if _calls_df_cache is None:
+            refresh_calls_cache()
+        return _calls_df_cache
+
+
+def build_company_aggregates(calls_df):
+    """
+    Agrupa una sola vez la data cruda por compañía:
+    - llamadas por (year, month) de cada compañía, como dict company_id -> DataFrame
+    - resumen por compañía (nombre, campañas, clientes, estados) como dict company_id -> valores
+    """
+    # Agregación en Arrow (hash group-by columnar) sobre los buffers del DataFrame.
+    # Se agrupa por el código entero de la categórica: las categorías están ordenadas,
+    # así que ordenar por código equivale a ordenar por company_id.
+    company_ids = calls_df['company_id'].astype('category')
+    # Un registro sin año o mes no puede ubicarse en la curva mensual
+    calls_table = pa.Table.from_pandas(
+        calls_df[['company_id', 'year', 'month', 'calls']]
+        .assign(company_id=company_ids.cat.codes)
+        .dropna(subset=['year', 'month']),
+        preserve_index=False,
+    )
+    monthly_by_company = (
+        calls_table.group_by(['company_id', 'year', 'month'])
+        .aggregate([('calls', 'sum')])
+        .sort_by([('company_id', 'ascending'), ('year', 'ascending'), ('month', 'ascending')])
+        .to_pandas(types_mapper=pd.ArrowDtype)
+        .rename(columns={'calls_sum': 'calls'})
+        [['company_id', 'year', 'month', 'calls']]
+        # Tipos numpy fijados una sola vez aquí y no en cada petición de análisis
+        .astype({'year': 'int64', 'month': 'int64', 'calls': 'float64'})
+    )
+    company_categories = company_ids.cat.categories
+    monthly_frames = {
+        company_categories[code]: company_df.assign(company_id=company_categories[code])
+        for code, company_df in monthly_by_company.groupby('company_id', sort=False)
+    }
+
+    summary_aggregations = {}
+    if 'company_name' in calls_df.columns:
+        summary_aggregations['company_name'] = ('company_name', 'first')
+    if 'campaigns' in calls_df.columns:
+        summary_aggregations['campaigns'] = ('campaigns', 'max')
+    if 'customers' in calls_df.columns:
+        summary_aggregations['customers'] = ('customers', 'sum')
+    if summary_aggregations:
+        company_summary = calls_df.groupby('company_id', observed=True).agg(**summary_aggregations)
+    else:
+        company_summary = pd.DataFrame(index=list(monthly_frames.keys()))
+    if 'state' in calls_df.columns:
+        # Pares únicos (compañía, estado) ordenados una sola vez para todas las compañías
+        company_states = calls_df[['company_id', 'state']].dropna(subset=['state'])
+        company_states = (
+            company_states.assign(state=company_states['state'].astype(str))
+            .drop_duplicates()
+            .sort_values(['company_id', 'state'])
+        )
+        states_by_company = company_states.groupby('company_id', observed=True)['state'].agg(list)
+        company_summary['states'] = [states_by_company.get(company_id, []) for company_id in company_summary.index]
+
+    return monthly_frames, company_summary.to_dict(orient='index')
+
+
+def precompute_default_analyses(monthly_frames, company_summaries, data_version):
+    """
+    Construye en paralelo el análisis por defecto de todas las compañías, ya serializado.
+    NumPy/Pandas liberan el GIL en sus kernels, por lo que los hilos sí se solapan.
+    Las compañías que fallen se omiten y se calcularán bajo demanda.
+    """
+    company_ids = list(monthly_frames.keys())
+
+    def build(company_id):
+        try:
+            return orjson.dumps(build_analysis_payload(
+                monthly_frames, company_summaries, company_id, DEFAULT_DETECTION_METHOD, DEFAULT_ANALYSIS_MODE
+            ), option=ORJSON_OPTIONS)
+        except Exception as e:
+            print(f"WARNING: No se pudo precalcular el análisis de {company_id}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        payloads = list(executor.map(build, company_ids))
+
+    return {
+        (str(company_id), DEFAULT_DETECTION_METHOD, DEFAULT_ANALYSIS_MODE, data_version): payload
+        for company_id, payload in zip(company_ids, payloads)
+        if payload is not None
+    }
+
+
+def get_company_aggregates():
+    """
+    Devuelve (versión de la data, agregados por compañía), recargando la data si la caché expiró.
+    La versión se lee antes que los agregados porque refresh_calls_cache la publica al final.
+    """
+    get_calls_info()
+    data_version = _last_data_fetch_time
+    return data_version, _monthly_frames, _company_summary
+
+
+def get_cached_analysis(cache_key):
+    """Respuesta serializada del análisis, o None si no está en caché."""
+    body = _precomputed_analyses.get(cache_key)
+    if body is not None:
+        return body
+    with _analysis_cache_lock:
+        body = _analysis_cache.get(cache_key)
+        if body is not None:
+            _analysis_cache.move_to_end(cache_key)
+        return body
+
+
+def store_cached_analysis(cache_key, body):
+    with _analysis_cache_lock:
+        _analysis_cache[cache_key] = body
+        _analysis_cache.move_to_end(cache_key)
+        while len(_analysis_cache) > ANALYSIS_CACHE_MAX_ENTRIES:
+            _analysis_cache.popitem(last=False)
+
+
 def normalize_detection_method(method):
     if not method:
         return "Hybrid (3-4 months)"
@@ -123,138 +396,186 @@ def normalize_analysis_mode(mode):
     return "percentages"
 
 
-def prepare_company_dataframe(calls_df, company_id):
+def prepare_company_dataframe(monthly_frames, company_id):
     company_id_str = str(company_id)
-    company_df = calls_df[calls_df['company_id'].astype(str) == company_id_str].copy()
-    if company_df.empty:
+    company_df = monthly_frames.get(company_id_str)
+    if company_df is None or company_df.empty:
         raise KeyError(f"No data found for company {company_id_str}")
     required_columns = {'year', 'month', 'calls'}
     if not required_columns.issubset(company_df.columns):
         raise ValueError("Dataset incompleto para el análisis de inflexión.")
-    company_df['year'] = company_df['year'].astype(int)
-    company_df['month'] = company_df['month'].astype(int)
-    company_df['calls'] = company_df['calls'].astype(float)
     return company_df, company_id_str
 
 
 def calculate_monthly_metrics(company_df):
-    monthly_totals = company_df.groupby('month')['calls'].sum()
     months = list(range(1, 13))
-    monthly_calls = np.array([float(monthly_totals.get(month, 0.0)) for month in months], dtype=float)
+    monthly_calls = (
+        company_df.groupby('month', sort=False)['calls']
+        .sum()
+        .reindex(months, fill_value=0.0)
+        .to_numpy(dtype=np.float64)
+    )
     total_calls = float(monthly_calls.sum())
-    if total_calls > 0:
-        monthly_percentages = (monthly_calls / total_calls) * 100.0
-    else:
-        monthly_percentages = np.zeros(12, dtype=float)
+    monthly_percentages = np.divide(
+        monthly_calls, total_calls, out=np.zeros(12, dtype=float), where=total_calls > 0
+    ) * 100.0
     return months, monthly_calls, monthly_percentages, total_calls
 
 
 def detect_peaks_valleys_quartiles(calls):
-    calls_array = np.array(calls, dtype=float)
+    calls_array = np.asarray(calls, dtype=float)
     if calls_array.size == 0:
         return np.array([], dtype=int), np.array([], dtype=int)
+    # Orden completo y no argpartition: con 12 valores no hay ahorro, y argpartition resuelve
+    # los empates (p. ej. meses en 0 de años parciales) en otro orden, cambiando los meses marcados.
+    # Se usa el `kind` por defecto a propósito: es el orden de empates del cálculo original
+    # (kind='stable' también difiere de él en los empates).
     sorted_indices = np.argsort(calls_array)
     valleys = np.sort(sorted_indices[:2])
     peaks = np.sort(sorted_indices[-2:])
     return peaks.astype(int), valleys.astype(int)
 
 
+def find_local_peaks(values, height, distance):
+    """
+    Equivalente a `scipy.signal.find_peaks(values, height=height, distance=distance)[0]`
+    para las series de 12 meses: en arrays tan cortos domina el overhead de llamada
+    y validación de SciPy, no el cálculo.
+
+    Replica exactamente la semántica de SciPy (no es una aproximación):
+    - máximos locales estrictos; una meseta cuenta como un pico en su punto medio
+      (redondeado hacia abajo) y los extremos del array nunca son picos;
+    - `height` es un mínimo inclusivo (>=);
+    - `distance` se aplica con ceil(distance), conservando primero los picos más altos.
+      El orden de los empates sale de `np.argsort` por defecto, igual que en SciPy;
+      no cambiarlo por `sorted()` ni por `kind='stable'`.
+
+    Cualquier cambio aquí debe volver a verificarse contra SciPy (instalado aparte):
+
+        rng = np.random.default_rng(0)
+        for _ in range(50_000):
+            x = rng.integers(0, 6, 12).astype(float)  # valores chicos: mesetas y empates
+            h, d = rng.uniform(0, 5), int(rng.integers(1, 5))
+            assert find_local_peaks(x, h, d).tolist() == find_peaks(x, height=h, distance=d)[0].tolist()
+    """
+    # Listas de Python: indexar escalares de NumPy uno a uno es más lento
+    values = np.asarray(values, dtype=float).tolist()
+    size = len(values)
+
+    # Máximos locales (las mesetas se representan por su punto medio)
+    peaks = []
+    i = 1
+    while i < size - 1:
+        if values[i - 1] < values[i]:
+            i_ahead = i + 1
+            while i_ahead < size - 1 and values[i_ahead] == values[i]:
+                i_ahead += 1
+            if values[i_ahead] < values[i]:
+                peaks.append((i + i_ahead - 1) // 2)
+                i = i_ahead
+        i += 1
+    peaks = [idx for idx in peaks if values[idx] >= height]
+
+    # Distancia mínima: se conservan primero los picos más altos
+    if len(peaks) > 1 and distance > 1:
+        min_distance = np.ceil(distance)
+        keep = [True] * len(peaks)
+        for j in np.argsort([values[idx] for idx in peaks])[::-1].tolist():
+            if not keep[j]:
+                continue
+            k = j - 1
+            while k >= 0 and peaks[j] - peaks[k] < min_distance:
+                keep[k] = False
+                k -= 1
+            k = j + 1
+            while k < len(peaks) and peaks[k] - peaks[j] < min_distance:
+                keep[k] = False
+                k += 1
+        peaks = [idx for idx, kept in zip(peaks, keep) if kept]
+    return np.array(peaks, dtype=int)
+
+
 def detect_inflection_points(monthly_percentages, method):
     method_normalized = normalize_detection_method(method)
-    percentages = np.array(monthly_percentages, dtype=float)
+    percentages = np.asarray(monthly_percentages, dtype=float)
     if percentages.size == 0:
         return np.array([], dtype=int), np.array([], dtype=int)
-    average = np.mean(percentages)
-    if method_normalized == "Original (find_peaks)":
-        peaks, _ = find_peaks(percentages, height=average, distance=2)
-        valleys, _ = find_peaks(-percentages, height=-average, distance=2)
-    elif method_normalized == "Mathematical Strict":
+    if method_normalized == "Mathematical Strict":
         peaks, valleys = detect_peaks_valleys_quartiles(percentages)
     else:
-        peaks, _ = find_peaks(percentages, height=average, distance=3)
-        valleys, _ = find_peaks(-percentages, height=-average, distance=3)
-    return np.array(peaks, dtype=int), np.array(valleys, dtype=int)
+        # Media y serie negada se calculan una sola vez para picos y valles
+        average = np.mean(percentages)
+        negated = -percentages
+        distance = 2 if method_normalized == "Original (find_peaks)" else 3
+        peaks = find_local_peaks(percentages, height=average, distance=distance)
+        valleys = find_local_peaks(negated, height=-average, distance=distance)
+    return np.asarray(peaks, dtype=int), np.asarray(valleys, dtype=int)
 
 
 def calculate_annual_data(company_df, mode):
     if company_df.empty:
         return None
-    yearly_monthly = (
-        company_df.groupby(['year', 'month'])['calls']
-        .sum()
-        .reset_index()
+    annual_table = (
+        company_df.pivot_table(index='year', columns='month', values='calls', aggfunc='sum', fill_value=0.0)
+        .reindex(columns=range(1, 13), fill_value=0.0)
+        .astype(float)
     )
-    if yearly_monthly.empty:
+    if annual_table.empty:
         return None
-    years = sorted(yearly_monthly['year'].unique())
-    months = list(range(1, 13))
-    annual_table = pd.DataFrame(0.0, index=years, columns=months)
-    for year in years:
-        year_data = yearly_monthly[yearly_monthly['year'] == year]
-        year_total = year_data['calls'].sum()
-        for month in months:
-            month_calls = year_data.loc[year_data['month'] == month, 'calls']
-            value = float(month_calls.iloc[0]) if not month_calls.empty else 0.0
-            if mode == 'percentages':
-                value = (value / year_total * 100.0) if year_total > 0 else 0.0
-            annual_table.at[year, month] = value
+    if mode == 'percentages':
+        year_totals = annual_table.sum(axis=1)
+        annual_table = annual_table.div(year_totals.where(year_totals > 0, 1.0), axis=0) * 100.0
     return annual_table
 
 
 def format_annual_table(annual_df, mode):
     if annual_df is None or annual_df.empty:
         return {}
-    table = {}
-    for year in annual_df.index:
-        row = {}
-        for month in annual_df.columns:
-            value = float(annual_df.loc[year, month])
-            if mode == 'percentages':
-                value = round(value, 2)
-            else:
-                value = int(round(value))
-            row[str(int(month))] = value
-        table[str(int(year))] = row
-    return table
+    # calculate_annual_data siempre devuelve las columnas 1..12 en orden
+    if mode == 'percentages':
+        values = annual_df.to_numpy(dtype=float).round(2)
+    else:
+        values = np.rint(annual_df.to_numpy(dtype=float)).astype(int)
+    return {
+        str(int(year)): dict(zip(MONTH_KEYS, row))
+        for year, row in zip(annual_df.index, values.tolist())
+    }
 
 
 def build_curve_data(months, monthly_calls, monthly_percentages):
-    curve = []
-    for idx, month in enumerate(months):
-        curve.append({
-            "month": int(month),
-            "percentage": round(float(monthly_percentages[idx]), 4),
-            "calls": float(monthly_calls[idx])
-        })
-    return curve
+    percentages = np.round(np.asarray(monthly_percentages, dtype=float), 4).tolist()
+    calls = np.asarray(monthly_calls, dtype=float).tolist()
+    return [
+        {"month": int(month), "percentage": percentage, "calls": month_calls}
+        for month, percentage, month_calls in zip(months, percentages, calls)
+    ]
 
 
-def build_analysis_payload(calls_df, company_id, detection_method, analysis_mode):
+def build_analysis_payload(monthly_frames, company_summaries, company_id, detection_method, analysis_mode):
     detection_method = normalize_detection_method(detection_method)
     analysis_mode = normalize_analysis_mode(analysis_mode)
-    company_df, company_id_str = prepare_company_dataframe(calls_df, company_id)
-    company_name = (
-        company_df['company_name'].dropna().iloc[0]
-        if 'company_name' in company_df.columns and not company_df['company_name'].dropna().empty
-        else company_id_str
-    )
+    company_df, company_id_str = prepare_company_dataframe(monthly_frames, company_id)
+    company_summary = company_summaries.get(company_id_str, {})
+    company_name = company_summary.get('company_name')
+    if company_name is None or pd.isna(company_name):
+        company_name = company_id_str
     months, monthly_calls, monthly_percentages, total_calls = calculate_monthly_metrics(company_df)
     peaks, valleys = detect_inflection_points(monthly_percentages, detection_method)
-    peak_months = sorted({int(months[idx]) for idx in peaks})
-    valley_months = sorted({int(months[idx]) for idx in valleys})
+    # Los índices de picos/valles ya vienen ordenados y sin repetidos: basta con indexar
+    month_numbers = np.asarray(months)
+    peak_months = month_numbers[peaks].tolist()
+    valley_months = month_numbers[valleys].tolist()
     curve_data = build_curve_data(months, monthly_calls, monthly_percentages)
     annual_df = calculate_annual_data(company_df, analysis_mode)
     annual_table = format_annual_table(annual_df, analysis_mode)
 
     summary = {}
-    if 'campaigns' in company_df.columns:
-        summary['campaigns'] = int(company_df['campaigns'].max())
-    if 'customers' in company_df.columns:
-        summary['customers'] = int(company_df['customers'].sum())
-    if 'state' in company_df.columns:
-        states = sorted({str(state) for state in company_df['state'].dropna().unique()})
-        if states:
-            summary['states'] = states
+    if 'campaigns' in company_summary:
+        summary['campaigns'] = int(company_summary['campaigns'])
+    if 'customers' in company_summary:
+        summary['customers'] = int(company_summary['customers'])
+    if company_summary.get('states'):
+        summary['states'] = company_summary['states']
 
     response = {
         "company_id": company_id_str,
@@ -267,9 +588,9 @@ def build_analysis_payload(calls_df, company_id, detection_method, analysis_mode
         "valley_months": valley_months,
         "annual_table": annual_table,
         "monthly_call_breakdown": {
-            "months": [int(m) for m in months],
-            "calls": [int(round(val)) for val in monthly_calls],
-            "percentages": [round(float(val), 4) for val in monthly_percentages]
+            "months": list(months),
+            "calls": np.rint(monthly_calls).astype(int).tolist(),
+            "percentages": np.round(monthly_percentages, 4).tolist()
         },
         "year_range": [
             int(company_df['year'].min()),
@@ -295,21 +616,14 @@ def get_companies():
         if df.empty:
             return jsonify({"error": "No data available"}), 500
             
-        if 'company_name' in df.columns:
-            companies_df = (
-                df[['company_id', 'company_name']]
-                .drop_duplicates()
-                .sort_values(by='company_name')
-            )
-        else:
-            company_ids = sorted(df['company_id'].unique().tolist())
-            companies_df = pd.DataFrame({
-                'company_id': company_ids,
-                'company_name': company_ids
-            })
-
-        companies = companies_df.to_dict(orient='records')
-        return jsonify({"companies": companies})
+        if request.accept_mimetypes.best_match(['application/json', ARROW_STREAM_MIMETYPE]) == ARROW_STREAM_MIMETYPE:
+            table = pa.Table.from_pandas(_companies_df, preserve_index=False)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return Response(sink.getvalue().to_pybytes(), mimetype=ARROW_STREAM_MIMETYPE)
+
+        return Response(_companies_json, mimetype='application/json')
         
     except Exception as e:
         print(f"Error en /api/companies: {e}")
@@ -331,9 +645,14 @@ def _handle_inflection_analysis_request():
         detection_method = normalize_detection_method(payload.get('detection_method'))
         analysis_mode = normalize_analysis_mode(payload.get('analysis_mode'))
 
-        df = get_calls_info()
-        result = build_analysis_payload(df, company_id, detection_method, analysis_mode)
-        return jsonify(result)
+        data_version, monthly_frames, company_summaries = get_company_aggregates()
+        cache_key = (str(company_id), detection_method, analysis_mode, data_version)
+        body = get_cached_analysis(cache_key)
+        if body is None:
+            result = build_analysis_payload(monthly_frames, company_summaries, company_id, detection_method, analysis_mode)
+            body = orjson.dumps(result, option=ORJSON_OPTIONS)
+            store_cached_analysis(cache_key, body)
+        return Response(body, mimetype='application/json')
 
     except KeyError as missing_error:
         return jsonify({
@@ -386,7 +705,6 @@ def serve_index():
 
 if __name__ == '__main__':
     # Usar el puerto de Cloud Run (o 8080 si se ejecuta localmente)
-    import os
     port = int(os.environ.get('PORT', 8080))
     # Para desarrollo local:
     # app.run(debug=True, host='0.0.0.0', port=port)